@@ -0,0 +1,422 @@
+"""
+Shared core for the ytd/ytdp entry points: metadata extraction and
+caching, format selection, transfer tuning, and the progress hook.
+Keeping these in one module means the disk cache, the YoutubeDL factory,
+and the pre-warmed player JS are shared no matter which script runs.
+"""
+import asyncio
+import bisect
+import functools
+import json
+import os
+import shutil
+from pathlib import Path
+import requests
+import yt_dlp
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from diskcache import Cache
+
+# yt-dlp funnels the multi-MB YouTube player-response blobs through
+# json.loads; orjson's C parser is several times faster on those, so
+# redirect the stdlib entry point when it is available. Must happen
+# before any extraction runs. Only bare json.loads(s) calls take the
+# fast path: yt-dlp also calls json.loads with cls=LenientJSONDecoder,
+# strict=False, etc. to tolerate trailing page text and broken JSON,
+# and orjson supports none of that, so those calls (and anything orjson
+# rejects) are delegated to the stdlib parser unchanged.
+try:
+    import orjson
+
+    _orig_loads = json.loads
+
+    def _orjson_loads(s, *args, **kwargs):
+        if args or kwargs:
+            return _orig_loads(s, *args, **kwargs)
+        try:
+            if isinstance(s, (bytes, bytearray, memoryview)):
+                return orjson.loads(s)
+            return orjson.loads(s.encode())
+        except Exception:
+            return _orig_loads(s)
+
+    json.loads = _orjson_loads
+except ImportError:
+    pass
+
+_cache = Cache('.ytcache')
+
+@dataclass(frozen=True, slots=True)
+class Resolution:
+    """
+    Target video height, parsed and validated once at the CLI boundary
+    so the hot paths compare plain ints instead of re-slicing strings.
+    """
+    height: int
+
+    @classmethod
+    def parse(cls, text):
+        return cls(int(str(text).rstrip('p')))
+
+    @property
+    def format_spec(self):
+        return f'bestvideo[height<={self.height}]+bestaudio/best'
+
+    def __str__(self):
+        return f"{self.height}p"
+
+@functools.lru_cache(maxsize=4)
+def _get_ydl(opts_items):
+    """
+    Shared YoutubeDL factory keyed on the option items. Reusing one
+    instance per option set keeps its HTTP connections alive, so repeated
+    info calls skip the TCP+TLS handshake.
+    """
+    return yt_dlp.YoutubeDL(dict(opts_items))
+
+@_cache.memoize(expire=3600)
+def _extract_info_cached(url):
+    """
+    Extract raw video metadata once and reuse it across calls.
+    Avoids yt-dlp re-fetching the page and player JS for the same URL.
+    Kept to an hour: the googlevideo format URLs inside the info dict
+    expire after a few hours, and a cached dict with dead URLs would
+    403 on every fragment.
+    """
+    ydl = _get_ydl((
+        ('quiet', True),
+        ('no_warnings', True),
+        ('socket_timeout', 30),
+        ('extractor_retries', 3),
+        ('cachedir', str(Path.home() / '.cache' / 'yt-dlp')),
+    ))
+    return ydl.extract_info(url, download=False)
+
+def _evict_cached_info(url):
+    """
+    Drop the memoized info dict for one URL, e.g. when its format URLs
+    turn out to have expired before the cache entry did.
+    """
+    try:
+        del _cache[_extract_info_cached.__cache_key__(url)]
+    except KeyError:
+        pass
+
+def _prewarm():
+    """
+    Fetch and parse the YouTube player JS in the background so the first
+    real extraction doesn't pay the cold-start cost.
+    """
+    try:
+        ydl = _get_ydl((
+            ('quiet', True),
+            ('no_warnings', True),
+            ('socket_timeout', 30),
+            ('cachedir', str(Path.home() / '.cache' / 'yt-dlp')),
+        ))
+        ydl.extract_info('https://youtu.be/jNQXAC9IVRw', download=False, process=False)
+    except Exception:
+        pass
+
+threading.Thread(target=_prewarm, daemon=True).start()
+
+def _external_downloader_opts():
+    """
+    Hand the byte-moving path to aria2c when it is installed. aria2c
+    opens per-segment connections outside the Python process, which
+    sidesteps both the GIL and YouTube's per-connection throttling.
+    Returns an empty dict when aria2c is unavailable so the caller falls
+    back to the native downloader.
+    """
+    if shutil.which('aria2c') is None:
+        return {}
+    return {
+        'external_downloader': 'aria2c',
+        'external_downloader_args': {
+            'aria2c': ['-x', '16', '-s', '16', '-k', '1M',
+                       '--file-allocation=none', '--summary-interval=0'],
+        },
+    }
+
+def _compute_transfer_params(url, probe_seconds=2.0):
+    """
+    Probe the connection briefly and derive chunk size and fragment
+    concurrency from the measured bandwidth-delay product. Small fixed
+    chunks never leave TCP slow-start on fat links, while oversized ones
+    waste RAM on thin ones. Falls back to the fixed defaults if the
+    probe fails.
+    """
+    defaults = {
+        'concurrent_fragments': 16,
+        'http_chunk_size': 10485760,
+        'buffersize': 1024 * 1024,
+    }
+    try:
+        start = time.monotonic()
+        response = requests.get(url, stream=True, timeout=10)
+        rtt = time.monotonic() - start
+        received = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            received += len(chunk)
+            if time.monotonic() - start >= probe_seconds:
+                break
+        response.close()
+        elapsed = time.monotonic() - start
+        if received == 0 or elapsed <= 0:
+            return defaults
+        bandwidth = received / elapsed  # bytes/s
+        bdp = bandwidth * rtt
+        bw_mbps = bandwidth * 8 / 1e6
+        # Cap concurrency by CPU count so small hosts aren't oversubscribed.
+        cpu_cap = max(4, (os.cpu_count() or 4) * 2)
+        return {
+            'concurrent_fragments': min(32, max(4, int(bw_mbps / 5)), cpu_cap),
+            'http_chunk_size': max(1 << 20, int(bdp * 4)),
+            'buffersize': max(64 * 1024, min(4 << 20, int(bdp))),
+        }
+    except Exception:
+        return defaults
+
+def _analyze_entry_with_retry(ydl, url, resolution, retries=3):
+    """
+    Fetch and summarize one playlist entry on a shared YoutubeDL instance,
+    with exponential backoff on rate-limit errors.
+    """
+    delay = 5
+    for attempt in range(retries):
+        try:
+            entry_info = ydl.extract_info(url, download=False, process=False)
+            if entry_info is None:
+                raise ValueError(f"Could not fetch information for {url}")
+            return _summarize_video(entry_info, resolution)
+        except Exception as e:
+            message = str(e)
+            if attempt < retries - 1 and ('429' in message or 'Too Many Requests' in message):
+                time.sleep(delay)
+                delay *= 2
+            else:
+                raise
+
+async def _analyze_entries(shared_ydl, entries, resolution, total_count,
+                           on_entry=None, max_concurrency=16):
+    """
+    Gather full per-entry info concurrently. A semaphore bounds how many
+    extractions are in flight; the blocking yt-dlp calls run on the
+    default executor via asyncio.to_thread, so there is no dedicated
+    worker-thread stack per playlist entry.
+
+    Per-video summaries are handed to on_entry (if given) as they arrive
+    and then dropped, so memory stays O(1) in the playlist length; only
+    running totals and the (small) skip list are kept.
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def analyze(entry):
+        async with sem:
+            try:
+                video_info = await asyncio.to_thread(
+                    _analyze_entry_with_retry, shared_ydl, entry['url'], resolution)
+                return entry, video_info, None
+            except Exception as e:
+                return entry, None, e
+
+    analyzed_count = 0
+    total_size = 0
+    total_duration = 0
+    skipped_videos = []
+    for task in asyncio.as_completed([analyze(entry) for entry in entries]):
+        entry, video_info, error = await task
+        if error is None:
+            analyzed_count += 1
+            total_size += video_info['size']
+            total_duration += video_info['duration']
+            if on_entry is not None:
+                on_entry(video_info)
+            print(f"\rAnalyzed {analyzed_count}/{total_count} videos...", end="")
+        else:
+            skipped_videos.append({
+                'title': entry.get('title', 'Unknown Title'),
+                'url': entry.get('url'),
+                'reason': str(error)
+            })
+            print(f"\nSkipping video '{entry.get('title', 'Unknown Title')}': {error}")
+    return analyzed_count, total_size, total_duration, skipped_videos
+
+def find_closest_resolution(sorted_heights, target_height):
+    """
+    Find the closest available resolution to the target height:
+    the largest height at or below the target, else the lowest available.
+    Expects the heights to be pre-sorted ascending.
+    """
+    if not sorted_heights:
+        return None
+    i = bisect.bisect_right(sorted_heights, target_height) - 1
+    return sorted_heights[i] if i >= 0 else sorted_heights[0]
+
+def _summarize_video(info, resolution):
+    """
+    Reduce a raw info dict to the per-video summary used by download_video.
+    """
+    target_height = resolution.height
+
+    title = info.get('title', 'Unknown Title')
+    duration = info.get('duration', 0)
+
+    formats = info.get('formats', [])
+    if not formats:
+        raise ValueError("No formats available for this video")
+
+    # One pass over formats: collect available heights, the best
+    # video format per height, and the best audio format.
+    heights = set()
+    best_video_by_height = {}
+    best_audio_format = None
+    best_audio_size = -1
+    for f in formats:
+        get = f.get
+        height = get('height') or 0
+        vcodec = get('vcodec')
+        acodec = get('acodec')
+        filesize = get('filesize') or 0
+        if height:
+            heights.add(height)
+            if vcodec != 'none':
+                current = best_video_by_height.get(height)
+                if current is None or filesize > (current.get('filesize') or 0):
+                    best_video_by_height[height] = f
+        if acodec != 'none' and vcodec == 'none' and filesize > best_audio_size:
+            best_audio_size = filesize
+            best_audio_format = f
+
+    if not heights:
+        raise ValueError("No video formats with height information found")
+    available_heights = sorted(heights)
+
+    # Find the best available resolution
+    target_height = find_closest_resolution(available_heights, target_height)
+    if target_height is None:
+        raise ValueError("No suitable video formats found")
+
+    best_video_format = best_video_by_height.get(target_height)
+    if best_video_format is None:
+        raise ValueError("No suitable video formats found")
+
+    # yt-dlp commonly reports filesize as None; treat unknown as 0.
+    video_size = best_video_format.get('filesize') or 0
+    audio_size = (best_audio_format.get('filesize') or 0) if best_audio_format else 0
+    total_size = video_size + audio_size
+
+    return {
+        'is_playlist': False,
+        'title': title,
+        'duration': duration,
+        'size': total_size,
+        'resolution': f"{target_height}p",
+        'available_resolutions': [f"{h}p" for h in available_heights]
+    }
+
+def get_video_info(url, resolution=Resolution(1080), is_playlist=False, on_entry=None):
+    """
+    Get video or playlist information without downloading.
+    Returns video/playlist information including title, format, and filesize.
+
+    For playlists, per-video summaries are streamed to the optional
+    on_entry callback instead of being buffered; the returned dict only
+    carries aggregate totals.
+    """
+    try:
+        if is_playlist:
+            ydl = _get_ydl((
+                ('quiet', True),
+                ('no_warnings', True),
+                ('socket_timeout', 30),
+                ('extract_flat', 'in_playlist'),
+                ('lazy_playlist', True),
+            ))
+            info = ydl.extract_info(url, download=False)
+        else:
+            info = _extract_info_cached(url)
+        if info is None:
+            raise ValueError(f"Could not fetch information for {url}")
+
+        if is_playlist:
+            playlist_title = info.get('title', 'Unknown Playlist')
+            entries = list(info.get('entries') or [])
+            if not entries:
+                raise ValueError("No videos found in playlist")
+
+            print("\nAnalyzing playlist videos...")
+
+            # Per-video extraction is pure network latency, so fan the
+            # requests out concurrently instead of paying one round-trip
+            # at a time. A single YoutubeDL instance is shared by all
+            # tasks so they reuse one cookie jar and connection pool
+            # rather than re-handshaking per entry.
+            shared_ydl = _get_ydl((
+                ('quiet', True),
+                ('no_warnings', True),
+                ('socket_timeout', 30),
+            ))
+            valid_entries = [entry for entry in entries if entry and entry.get('url')]
+            video_count, total_size, total_duration, skipped_videos = asyncio.run(
+                _analyze_entries(shared_ydl, valid_entries, resolution,
+                                 len(entries), on_entry))
+
+            print("\nPlaylist analysis completed.")
+
+            return {
+                'is_playlist': True,
+                'title': playlist_title,
+                'video_count': video_count,
+                'skipped_videos': skipped_videos,
+                'total_size': total_size,
+                'total_duration': total_duration,
+                # Just the URL strings, so the download phase doesn't
+                # have to repeat the flat extraction.
+                'entry_urls': [entry['url'] for entry in valid_entries]
+            }
+
+        else:
+            return _summarize_video(info, resolution)
+
+    except Exception as e:
+        raise Exception(f"Failed to get info: {str(e)}")
+
+# Pre-bound fixed-width templates: one .format call per tick instead of
+# rebuilding an f-string, and a constant line width so a shorter update
+# never leaves stale characters behind the carriage return.
+_PROG_TPL = "\r[{fn:<40.40}] Progress: {pct:5.1f}% | Speed: {spd:6.1f}MB/s".format
+_PROG_TPL_NOSIZE = "\r[{fn:<40.40}] Downloaded: {mb:7.1f}MB | Speed: {spd:6.1f}MB/s".format
+
+# The hook is called from every fragment thread; the throttle gate and
+# the stdout write share one lock so ticks can't interleave.
+_print_lock = threading.Lock()
+_last_print = [0.0]
+
+def show_progress(d):
+    """Show download progress, throttled to ~10 updates per second."""
+    if d['status'] != 'downloading':
+        return
+
+    # The hook fires hundreds of times per second with concurrent
+    # fragments; skipping most ticks keeps stdout off the critical path.
+    now = time.monotonic()
+    with _print_lock:
+        if now - _last_print[0] < 0.1:
+            return
+        _last_print[0] = now
+
+        downloaded = d.get('downloaded_bytes', 0)
+        total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+        speed = d.get('speed', 0)
+        filename = d.get('filename', '').split('/')[-1]
+
+        speed_mb = speed / (1024 * 1024) if speed else 0
+        if total > 0:
+            line = _PROG_TPL(fn=filename, pct=(downloaded / total) * 100, spd=speed_mb)
+        else:
+            line = _PROG_TPL_NOSIZE(fn=filename, mb=downloaded / (1024 * 1024), spd=speed_mb)
+        sys.stdout.buffer.write(line.encode())
+        sys.stdout.buffer.flush()